@@ -0,0 +1,17 @@
+import multiprocessing
+import os
+
+from uvicorn_worker import UvicornWorker
+
+
+class Worker(UvicornWorker):
+    # uvicorn settings that have no gunicorn equivalent
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools", "limit_concurrency": 1024}
+
+
+bind = "0.0.0.0:8000"
+worker_class = Worker
+# Each worker runs its own lifespan, ApiClient and informers
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+backlog = 2048
+timeout = 120
@@ -1,11 +1,75 @@
-from fastapi import FastAPI, WebSocket, HTTPException
+import asyncio
+import logging
+from contextlib import asynccontextmanager, contextmanager
+
+import orjson
+import ormsgpack
+from fastapi import Depends, FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi.exceptions import RequestValidationError
+from fastapi.requests import HTTPConnection, Request
 from fastapi.middleware.cors import CORSMiddleware
-from kubernetes import client, config, watch
-from pydantic import BaseModel
-from typing import Dict, Any, Optional
+from fastapi.responses import ORJSONResponse, Response
+from kubernetes_asyncio import client, config, watch
+from pydantic import BaseModel, ValidationError
+from typing import Dict, Any, List, Optional, Set, Type
+
+
+logger = logging.getLogger(__name__)
+
+
+async def load_kube_configuration():
+    # Load kubeconfig (try in-cluster first, then local kubeconfig)
+    try:
+        config.load_incluster_config()  # For running inside a Kubernetes pod
+    except config.ConfigException:
+        try:
+            await config.load_kube_config()  # For local development
+        except config.ConfigException:
+            raise Exception("Could not load Kubernetes configuration. Make sure you have access to a Kubernetes cluster.")
+
+
+# Maximum number of concurrent connections to the Kubernetes API server
+CONNECTION_POOL_MAXSIZE = 200
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await load_kube_configuration()
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = CONNECTION_POOL_MAXSIZE
+    # One ApiClient per process so its connection pool is reused across requests
+    async with client.ApiClient(configuration) as api_client:
+        app.state.api = client.CustomObjectsApi(api_client)
+        app.state.limiter = AdaptiveLimiter(
+            INITIAL_CONCURRENCY, MIN_CONCURRENCY, MAX_CONCURRENCY
+        )
+        # WebSocket connections register a queue here to receive informer events
+        app.state.subscribers = set()
+        app.state.informers = {
+            resource: Informer(
+                app.state.api, app.state.limiter, resource, app.state.subscribers
+            )
+            for resource in RESOURCES
+        }
+        tasks = [
+            asyncio.create_task(informer.run())
+            for informer in app.state.informers.values()
+        ]
+        yield
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
-app = FastAPI()
+def get_api(connection: HTTPConnection) -> client.CustomObjectsApi:
+    return connection.app.state.api
+
+
+def get_limiter(connection: HTTPConnection) -> "AdaptiveLimiter":
+    return connection.app.state.limiter
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Allow all origins (change this in production)
@@ -15,43 +79,263 @@ app.add_middleware(
 )
 
 
-# Load kubeconfig (try in-cluster first, then local kubeconfig)
-try:
-    config.load_incluster_config()  # For running inside a Kubernetes pod
-except config.ConfigException:
-    try:
-        config.load_kube_config()  # For local development
-    except config.ConfigException:
-        raise Exception("Could not load Kubernetes configuration. Make sure you have access to a Kubernetes cluster.")
-api = client.CustomObjectsApi()
-
 NAMESPACE = "kube-system"
 GROUP = "kubeovn.io"
 VERSION = "v1"
 
-RESOURCES: tuple[list[str]] = [
-    "vpcs",
-    "subnets",
-    "ippools",
-    "ips",
-    "iptables-dnat-rules",
-    "iptables-eips",
-    "iptables-fip-rules",
-    "iptables-snat-rules",
-    "ovn-dnat-rules",
-    "ovn-eips",
-    "ovn-fips",
-    "ovn-snat-rules",
-    "provider-networks",
-    "qos-policies",
-    "security-groups",
-    "switch-lb-rules",
-    "vips",
-    "vlans",
-    "vpc-dnses",
-    "vpc-nat-gateways",
-]
-NAMESPACED_RESOURCES: tuple[list[str]] = []
+# Kind for each supported resource plural (handles plural to singular and special cases)
+KIND_MAPPING: Dict[str, str] = {
+    "vpcs": "Vpc",
+    "subnets": "Subnet",
+    "ippools": "IpPool",
+    "ips": "IP",
+    "iptables-dnat-rules": "IptablesDnatRule",
+    "iptables-eips": "IptablesEIP",
+    "iptables-fip-rules": "IptablesFIPRule",
+    "iptables-snat-rules": "IptablesSnatRule",
+    "ovn-dnat-rules": "OvnDnatRule",
+    "ovn-eips": "OvnEip",
+    "ovn-fips": "OvnFip",
+    "ovn-snat-rules": "OvnSnatRule",
+    "provider-networks": "ProviderNetwork",
+    "qos-policies": "QoSPolicy",
+    "security-groups": "SecurityGroup",
+    "switch-lb-rules": "SwitchLBRule",
+    "vips": "Vip",
+    "vlans": "Vlan",
+    "vpc-dnses": "VpcDns",
+    "vpc-nat-gateways": "VpcNatGateway",
+}
+RESOURCES: frozenset[str] = frozenset(KIND_MAPPING)
+NAMESPACED_RESOURCES: frozenset[str] = frozenset()
+
+# Field manager recorded by server-side apply for changes made through this API
+FIELD_MANAGER = "kubeovnapi"
+
+# Number of objects requested per LIST page
+LIST_PAGE_SIZE = 500
+# Seconds a request waits for a resource's first LIST to complete
+SYNC_TIMEOUT = 10
+# Seconds an informer waits before reconnecting after an error, doubling
+# on each consecutive failure up to MAX_RETRY_DELAY
+RETRY_DELAY = 1
+MAX_RETRY_DELAY = 60
+# Seconds a watch must stay up, if it delivers nothing, before its failure
+# no longer counts towards the backoff
+HEALTHY_WATCH_DURATION = 30
+# Events buffered per WebSocket connection before the oldest are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Seconds a WebSocket send may take before the client is considered stalled
+SEND_TIMEOUT = 30
+# Most events sent in a single WebSocket frame
+BATCH_SIZE = 100
+# Seconds to wait for further events before sending a partial batch
+BATCH_WINDOW = 0.01
+# WebSocket subprotocol for clients that want MessagePack frames instead of JSON
+MSGPACK_SUBPROTOCOL = "msgpack"
+# Bounds for the number of concurrent API server requests per worker process
+# (watches excluded); N workers may have up to N * MAX_CONCURRENCY in flight
+INITIAL_CONCURRENCY = 16
+MIN_CONCURRENCY = 4
+MAX_CONCURRENCY = 128
+# API server statuses that mean it is shedding load
+OVERLOAD_STATUSES = frozenset({429, 503})
+
+
+class AdaptiveLimiter:
+    """Limits concurrent API server requests, adapting the limit to overload
+
+    The limit is halved when the API server answers 429 or 503 and grows by
+    about one for each limit's worth of successful requests (AIMD). Requests
+    already in flight when the limit was last halved were sent under the old
+    limit, so their overload responses do not halve it again; a burst of
+    throttled requests counts as a single congestion event.
+
+    The limit applies per worker process.
+    """
+
+    def __init__(self, initial: int, minimum: int, maximum: int):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        # Incremented on each decrease so requests know which window they belong to
+        self.epoch = 0
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one unit of concurrency for the duration of an API server request"""
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        epoch = self.epoch
+        try:
+            yield
+        except client.rest.ApiException as e:
+            if e.status in OVERLOAD_STATUSES and epoch == self.epoch:
+                self.limit = max(self.minimum, self.limit / 2)
+                self.epoch += 1
+            raise
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+        finally:
+            async with self.condition:
+                self.in_flight -= 1
+                self.condition.notify_all()
+
+
+class Informer:
+    """Keeps an in-memory copy of one resource type in sync with the API server"""
+
+    def __init__(
+        self,
+        api: client.CustomObjectsApi,
+        limiter: AdaptiveLimiter,
+        resource: str,
+        subscribers: Set[asyncio.Queue],
+    ):
+        self.api = api
+        self.limiter = limiter
+        self.resource = resource
+        self.subscribers = subscribers
+        self.objects: Dict[str, Dict[str, Any]] = {}
+        self.synced = asyncio.Event()
+        # Set once the first LIST has either succeeded or failed
+        self.attempted = asyncio.Event()
+        # Last list or watch failure, cleared once the API server answers again
+        self.error: Optional[Exception] = None
+        # When the current watch started and whether it has delivered any
+        # event or bookmark, used to tell a working watch from a failing one
+        self.watch_started: Optional[float] = None
+        self.watch_received = False
+        # JSON encoding of objects, cleared whenever the cache changes
+        self.encoded: Optional[bytes] = None
+
+    def as_json(self) -> bytes:
+        """Return the cached objects as a JSON array, re-encoded only after a change"""
+        if self.encoded is None:
+            self.encoded = orjson.dumps(list(self.objects.values()))
+        return self.encoded
+
+    def publish(self, event_type: str, obj: Dict[str, Any]):
+        event = {"resource": self.resource, "type": event_type, "object": obj}
+        for queue in self.subscribers:
+            if queue.full():
+                # Drop the oldest event rather than let a slow client hold us up
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    async def list(self) -> str:
+        """Replace the cache with a full LIST and return its resourceVersion"""
+        objects = {}
+        # resourceVersion=0 lets the apiserver answer from its watch cache instead
+        # of reading through to etcd; the cache may ignore the limit entirely
+        async with self.limiter.slot():
+            page = await self.api.list_cluster_custom_object(
+                GROUP,
+                VERSION,
+                self.resource,
+                limit=LIST_PAGE_SIZE,
+                resource_version="0",
+                resource_version_match="NotOlderThan",
+            )
+        while True:
+            for obj in page["items"]:
+                objects[obj["metadata"]["name"]] = obj
+            _continue = page["metadata"].get("continue")
+            if not _continue:
+                break
+            async with self.limiter.slot():
+                page = await self.api.list_cluster_custom_object(
+                    GROUP,
+                    VERSION,
+                    self.resource,
+                    limit=LIST_PAGE_SIZE,
+                    _continue=_continue,
+                )
+        # Publish the difference so subscribers stay correct across a relist
+        for name, obj in objects.items():
+            current = self.objects.get(name)
+            if current is None:
+                self.publish("ADDED", obj)
+            elif (
+                current["metadata"]["resourceVersion"]
+                != obj["metadata"]["resourceVersion"]
+            ):
+                self.publish("MODIFIED", obj)
+        for name in self.objects.keys() - objects.keys():
+            self.publish("DELETED", self.objects[name])
+        self.objects = objects
+        self.encoded = None
+        self.error = None
+        self.synced.set()
+        self.attempted.set()
+        return page["metadata"]["resourceVersion"]
+
+    async def watch(self, resource_version: str):
+        """Apply watch events to the cache, starting after resource_version"""
+        self.watch_started = asyncio.get_running_loop().time()
+        async with watch.Watch() as w:
+            async for event in w.stream(
+                self.api.list_cluster_custom_object,
+                GROUP,
+                VERSION,
+                self.resource,
+                resource_version=resource_version,
+                allow_watch_bookmarks=True,
+            ):
+                self.error = None
+                self.watch_received = True
+                obj = event["object"]
+                if event["type"] in ("ADDED", "MODIFIED"):
+                    self.objects[obj["metadata"]["name"]] = obj
+                elif event["type"] == "DELETED":
+                    self.objects.pop(obj["metadata"]["name"], None)
+                else:
+                    continue
+                self.encoded = None
+                self.publish(event["type"], obj)
+
+    def watch_was_healthy(self, loop: asyncio.AbstractEventLoop) -> bool:
+        if self.watch_received:
+            return True
+        return (
+            self.watch_started is not None
+            and loop.time() - self.watch_started >= HEALTHY_WATCH_DURATION
+        )
+
+    async def run(self):
+        """List and watch forever, relisting on 410 Gone and backing off on other errors"""
+        delay = RETRY_DELAY
+        loop = asyncio.get_running_loop()
+        while True:
+            self.watch_started = None
+            self.watch_received = False
+            try:
+                await self.watch(await self.list())
+                continue
+            except client.rest.ApiException as e:
+                if e.status == 410 and self.watch_was_healthy(loop):
+                    # Our resourceVersion was compacted away; relist immediately
+                    logger.info(f"Watch for {self.resource} expired, relisting")
+                    continue
+                self.error = e
+                reason = f"({e.status}) {e.reason}"
+            except Exception as e:
+                self.error = e
+                reason = repr(e)
+            self.attempted.set()
+            if self.watch_was_healthy(loop):
+                # The watch was working before it failed, so back off afresh.
+                # A successful LIST alone does not count: if the watch keeps
+                # failing, relisting every RETRY_DELAY would hammer the apiserver
+                delay = RETRY_DELAY
+            logger.warning(
+                f"Informer for {self.resource} failed, retrying in {delay}s: {reason}"
+            )
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
 
 
 class PatchBody(BaseModel):
@@ -64,93 +348,113 @@ class CreateBody(BaseModel):
     spec: Dict[str, Any]
 
 
-@app.get("/api/{resource}")
-async def get_resources(resource: str):
-    if resource not in RESOURCES:
-        return {"error": "Invalid resource type"}
-    try:
-        result = api.list_cluster_custom_object(GROUP, VERSION, resource)
-        return result["items"]
-    except Exception as e:
-        return {"error": str(e)}
+def json_body(model: Type[BaseModel]):
+    """Dependency that parses the request body straight into model
 
+    pydantic-core parses and validates the raw bytes in one pass, instead of
+    FastAPI decoding with the json module and then validating the result.
+    """
 
-@app.post("/api/{resource}")
-async def create_resource(resource: str, create_body: CreateBody):
-    """Create a new resource with full specification"""
-    if resource not in RESOURCES:
-        raise HTTPException(status_code=400, detail="Invalid resource type")
+    async def parse(request: Request) -> BaseModel:
+        try:
+            return model.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise RequestValidationError(
+                [
+                    {**error, "loc": ("body", *error["loc"])}
+                    for error in e.errors(include_url=False)
+                ]
+            )
 
-    # Determine the correct Kind name (handle plural to singular and special cases)
-    kind_mapping = {
-        "vpcs": "Vpc",
-        "subnets": "Subnet",
-        "ippools": "IpPool",
-        "ips": "IP",
-        "iptables-dnat-rules": "IptablesDnatRule",
-        "iptables-eips": "IptablesEIP",
-        "iptables-fip-rules": "IptablesFIPRule",
-        "iptables-snat-rules": "IptablesSnatRule",
-        "ovn-dnat-rules": "OvnDnatRule",
-        "ovn-eips": "OvnEip",
-        "ovn-fips": "OvnFip",
-        "ovn-snat-rules": "OvnSnatRule",
-        "provider-networks": "ProviderNetwork",
-        "qos-policies": "QoSPolicy",
-        "security-groups": "SecurityGroup",
-        "switch-lb-rules": "SwitchLBRule",
-        "vips": "Vip",
-        "vlans": "Vlan",
-        "vpc-dnses": "VpcDns",
-        "vpc-nat-gateways": "VpcNatGateway",
-    }
+    return parse
 
-    kind = kind_mapping.get(resource, resource.capitalize())
 
-    manifest = {
-        "apiVersion": f"{GROUP}/{VERSION}",
-        "kind": kind,
-        "metadata": {"name": create_body.name},
-        "spec": create_body.spec,
+def body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """OpenAPI request body for routes that read their body through json_body"""
+    return {
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": model.model_json_schema()}},
+        }
     }
 
-    # Add namespace if provided
-    if create_body.namespace:
-        manifest["metadata"]["namespace"] = create_body.namespace
 
-    try:
-        response = api.create_cluster_custom_object(GROUP, VERSION, resource, manifest)
-        return response
-    except client.rest.ApiException as e:
-        if e.status == 409:
-            raise HTTPException(
-                status_code=409, detail=f"{kind} '{create_body.name}' already exists"
+async def apply_resource(
+    api: client.CustomObjectsApi, resource: str, name: str, manifest: Dict[str, Any]
+) -> Dict[str, Any]:
+    """Server-side apply a manifest and return the resulting object"""
+    # The generated client only deserializes 200 responses, but apply answers
+    # 201 when it creates the object, so read the raw response ourselves
+    response = await api.patch_cluster_custom_object(
+        GROUP,
+        VERSION,
+        resource,
+        name,
+        manifest,
+        field_manager=FIELD_MANAGER,
+        force=True,
+        _content_type="application/apply-patch+yaml",
+        _preload_content=False,
+    )
+    async with response:
+        data = await response.read()
+    if not 200 <= response.status <= 299:
+        error = client.rest.ApiException(
+            http_resp=client.rest.RESTResponse(response, data)
+        )
+        # ApiClient.call_api normally decodes the body before raising
+        error.body = data.decode("utf-8")
+        raise error
+    return orjson.loads(data)
+
+
+@app.get("/api/{resource}")
+async def get_resources(resource: str, connection: HTTPConnection):
+    if resource not in RESOURCES:
+        return {"error": "Invalid resource type"}
+    informer = connection.app.state.informers[resource]
+    if not informer.synced.is_set():
+        try:
+            await asyncio.wait_for(informer.attempted.wait(), SYNC_TIMEOUT)
+        except asyncio.TimeoutError:
+            return ORJSONResponse(
+                {"error": f"Timed out waiting for {resource} to sync"},
+                status_code=504,
             )
-        raise HTTPException(status_code=e.status, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        if not informer.synced.is_set():
+            # The first LIST failed; report why instead of an empty list
+            error = informer.error
+            status_code = 502
+            # Only a 404 describes the resource itself (e.g. the CRD is
+            # missing); anything else, like 401/403, is an upstream failure
+            if isinstance(error, client.rest.ApiException) and error.status == 404:
+                status_code = 404
+            return ORJSONResponse({"error": str(error)}, status_code=status_code)
+    headers = {}
+    if informer.error is not None:
+        # The watch is failing, so the cache may be missing recent changes
+        headers["Warning"] = f'110 - "{resource} cache may be stale"'
+    # Polling clients share one encoding of the cache until it next changes
+    return Response(informer.as_json(), media_type="application/json", headers=headers)
 
 
-@app.patch("/api/{resource}/{resource_name}")
-async def patch_resource(resource: str, resource_name: str, patch_body: PatchBody):
-    """Update any resource's specifications"""
+def valid_resource(resource: str) -> str:
     if resource not in RESOURCES:
         raise HTTPException(status_code=400, detail="Invalid resource type")
+    return resource
 
-    try:
-        # Get the current resource
-        current = api.get_cluster_custom_object(GROUP, VERSION, resource, resource_name)
 
-        # Update the spec with provided changes
-        current["spec"].update(patch_body.spec)
+@contextmanager
+def api_errors(resource: str, resource_name: Optional[str] = None):
+    """Translate Kubernetes client errors into HTTP errors
 
-        # Apply the patch
-        response = api.patch_cluster_custom_object(
-            GROUP, VERSION, resource, resource_name, current
-        )
-        return response
+    A 404 is reported as the named resource not being found only when
+    resource_name is given; otherwise the API server's error is passed through.
+    """
+    try:
+        yield
     except client.rest.ApiException as e:
-        if e.status == 404:
+        if e.status == 404 and resource_name is not None:
             raise HTTPException(
                 status_code=404,
                 detail=f"{resource.capitalize()} '{resource_name}' not found",
@@ -160,51 +464,129 @@ async def patch_resource(resource: str, resource_name: str, patch_body: PatchBod
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.post("/api/{resource}", openapi_extra=body_schema(CreateBody))
+async def create_resource(
+    create_body: CreateBody = Depends(json_body(CreateBody)),
+    resource: str = Depends(valid_resource),
+    api: client.CustomObjectsApi = Depends(get_api),
+    limiter: AdaptiveLimiter = Depends(get_limiter),
+):
+    """Create or update a resource with full specification"""
+    manifest = {
+        "apiVersion": f"{GROUP}/{VERSION}",
+        "kind": KIND_MAPPING[resource],
+        "metadata": {"name": create_body.name},
+        "spec": create_body.spec,
+    }
+
+    # Add namespace if provided
+    if create_body.namespace:
+        manifest["metadata"]["namespace"] = create_body.namespace
+
+    # A 404 here means the CRD is missing, not the object, so pass it through
+    with api_errors(resource):
+        # Server-side apply creates the resource or updates an existing one
+        # in a single idempotent request
+        async with limiter.slot():
+            return await apply_resource(api, resource, create_body.name, manifest)
+
+
+@app.patch("/api/{resource}/{resource_name}", openapi_extra=body_schema(PatchBody))
+async def patch_resource(
+    resource_name: str,
+    patch_body: PatchBody = Depends(json_body(PatchBody)),
+    resource: str = Depends(valid_resource),
+    api: client.CustomObjectsApi = Depends(get_api),
+    limiter: AdaptiveLimiter = Depends(get_limiter),
+):
+    """Update any resource's specifications"""
+    with api_errors(resource, resource_name):
+        # A JSON merge patch updates only the given spec fields on the server,
+        # so there is no need to fetch and resend the whole object
+        async with limiter.slot():
+            return await api.patch_cluster_custom_object(
+                GROUP,
+                VERSION,
+                resource,
+                resource_name,
+                {"spec": patch_body.spec},
+                _content_type="application/merge-patch+json",
+            )
+
+
 @app.delete("/api/{resource}/{resource_name}")
-async def delete_resource(resource: str, resource_name: str):
+async def delete_resource(
+    resource_name: str,
+    resource: str = Depends(valid_resource),
+    api: client.CustomObjectsApi = Depends(get_api),
+    limiter: AdaptiveLimiter = Depends(get_limiter),
+):
     """Delete any resource"""
-    if resource not in RESOURCES:
-        raise HTTPException(status_code=400, detail="Invalid resource type")
+    with api_errors(resource, resource_name):
+        # The DELETE itself reports a missing resource as 404
+        async with limiter.slot():
+            await api.delete_cluster_custom_object(
+                GROUP, VERSION, resource, resource_name
+            )
+    return {"message": f"{resource.capitalize()} '{resource_name}' deleted successfully"}
 
-    try:
-        # Check if resource exists first
-        api.get_cluster_custom_object(GROUP, VERSION, resource, resource_name)
 
-        # Delete the resource
-        response = api.delete_cluster_custom_object(
-            GROUP, VERSION, resource, resource_name
-        )
-        return {
-            "message": f"{resource.capitalize()} '{resource_name}' deleted successfully"
-        }
-    except client.rest.ApiException as e:
-        if e.status == 404:
-            raise HTTPException(
-                status_code=404,
-                detail=f"{resource.capitalize()} '{resource_name}' not found",
-            )
-        raise HTTPException(status_code=e.status, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def send_events(
+    websocket: WebSocket, events: List[Dict[str, Any]], use_msgpack: bool
+):
+    if use_msgpack:
+        send = websocket.send_bytes(ormsgpack.packb(events))
+    else:
+        send = websocket.send_text(orjson.dumps(events).decode())
+    # A client that stops reading would otherwise park this handler forever
+    await asyncio.wait_for(send, SEND_TIMEOUT)
+
+
+async def next_batch(events: asyncio.Queue) -> List[Dict[str, Any]]:
+    """Wait for an event, then collect any others arriving within BATCH_WINDOW"""
+    batch = [await events.get()]
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BATCH_WINDOW
+    while len(batch) < BATCH_SIZE:
+        try:
+            batch.append(events.get_nowait())
+        except asyncio.QueueEmpty:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(events.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+    return batch
 
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
-    w = watch.Watch()
+    """Stream resource events, sent as arrays of up to BATCH_SIZE events
+
+    Frames are JSON text unless the client requests the msgpack subprotocol,
+    in which case they are binary MessagePack.
+    """
+    use_msgpack = MSGPACK_SUBPROTOCOL in websocket.scope["subprotocols"]
+    await websocket.accept(subprotocol=MSGPACK_SUBPROTOCOL if use_msgpack else None)
+    state = websocket.app.state
+    events: asyncio.Queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+    state.subscribers.add(events)
     try:
-        for resource in RESOURCES:
-            for event in w.stream(
-                api.list_cluster_custom_object, GROUP, VERSION, resource
-            ):
-                await websocket.send_json(
-                    {
-                        "resource": resource,
-                        "type": event["type"],
-                        "object": event["object"],
-                    }
-                )
+        # Replay the current cache contents, then follow the informers' events
+        snapshot = [
+            {"resource": resource, "type": "ADDED", "object": obj}
+            for resource, informer in state.informers.items()
+            for obj in informer.objects.values()
+        ]
+        for i in range(0, len(snapshot), BATCH_SIZE):
+            await send_events(websocket, snapshot[i : i + BATCH_SIZE], use_msgpack)
+        while True:
+            await send_events(websocket, await next_batch(events), use_msgpack)
+    except WebSocketDisconnect:
+        pass
     except Exception as e:
-        print(f"WebSocket error: {e}")
+        logger.warning(f"WebSocket error: {e!r}")
     finally:
-        w.stop()
+        state.subscribers.discard(events)